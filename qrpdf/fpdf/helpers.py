@@ -4,8 +4,11 @@ __author__ = "Arthur Moore <Arthur.Moore.git@cd-net.net>"
 __copyright__ = "Copyright (C) 2021 Arthur Moore"
 __license__ = "MIT"
 
+from functools import cache
 from typing import Union, Iterable, Dict
 
+import numpy as np
+
 # These are the numbers used by fpdf. Assumes 72 dpi
 FPDF_UNITS: Dict[str, float] = {
     "pt": 1.0,
@@ -15,6 +18,7 @@ FPDF_UNITS: Dict[str, float] = {
 }
 
 
+@cache
 def get_scale_factor(unit: Union[str, float]) -> float:
     """
     Get how many pts are in a unit.
@@ -30,6 +34,12 @@ def get_scale_factor(unit: Union[str, float]) -> float:
     return k
 
 
+@cache
+def _unit_factor(old_unit: Union[str, float, int], new_unit: Union[str, float, int]) -> float:
+    """ Memoized scale factor between two units; divide by this to convert """
+    return get_scale_factor(new_unit) / get_scale_factor(old_unit)
+
+
 def convert_unit(
         to_convert: Union[float, int, Iterable[Union[float, int, Iterable]]],
         old_unit: Union[str, float, int], new_unit: Union[str, float, int]
@@ -42,9 +52,33 @@ def convert_unit(
     :param new_unit: A unit accepted by fpdf.FPDF or a number
     :return: to_convert converted from old_unit to new_unit or a tuple of the same
     """
-    unit_conversion_factor = get_scale_factor(new_unit) / get_scale_factor(old_unit)
+    # Nothing to convert; skip the scale factor lookups and divide entirely.
+    # Nesting is still normalized to the deep tuples the converting path returns.
+    if old_unit == new_unit:
+        if isinstance(to_convert, Iterable):
+            return tuple(convert_unit(i, old_unit, new_unit) if isinstance(i, Iterable) else i
+                         for i in to_convert)
+        return to_convert
+    unit_conversion_factor = _unit_factor(old_unit, new_unit)
+    # Fast path: exact type checks are much cheaper than the Iterable ABC check below
+    if type(to_convert) is float or type(to_convert) is int:
+        return to_convert / unit_conversion_factor
     if isinstance(to_convert, Iterable):
-        return tuple(
-            map(lambda i: convert_unit(i, 1, unit_conversion_factor), to_convert)
-        )
+        if not isinstance(to_convert, (tuple, list)):
+            # Generators and sets have no shape for asarray, and a failed
+            # attempt would consume a generator; materialize once up front
+            to_convert = tuple(to_convert)
+        try:
+            converted = (np.asarray(to_convert, dtype=float) / unit_conversion_factor).tolist()
+        except (ValueError, TypeError):
+            # Jagged input; fall back to per-element recursion
+            return tuple(
+                map(lambda i: convert_unit(i, 1, unit_conversion_factor), to_convert)
+            )
+        return _as_nested_tuples(converted)
     return to_convert / unit_conversion_factor
+
+
+def _as_nested_tuples(converted: list) -> tuple:
+    """ Convert (possibly nested) lists into the tuples `convert_unit` has always returned """
+    return tuple(_as_nested_tuples(i) if isinstance(i, list) else i for i in converted)
@@ -7,9 +7,15 @@ from qrcode.image.base import BaseImage
 from qrcode.constants import ERROR_CORRECT_L, ERROR_CORRECT_M, ERROR_CORRECT_Q, ERROR_CORRECT_H
 from typing_extensions import Literal
 
+from .qr_cache import build_qr_matrix
+from .qr_fastdraw import draw_matrix_runs
+
 # The arguments that qrcode.QRCode accepts
 QRCODE_KWARGS = set(signature(qrcode.QRCode).parameters.keys())
 
+# The subset of those arguments that actually change the module matrix
+MATRIX_KWARGS = {"version", "error_correction", "mask_pattern"} & QRCODE_KWARGS
+
 
 class QrElement(NamedTuple):
     name: str
@@ -30,6 +36,11 @@ class QrElement(NamedTuple):
 
 def qr_handler(pdf: FPDF, *_, x1=0, y1=0, x2=0, y2=0, text="", **kwargs):
     """ fpdf.Template Handler for QR codes """
-    if text:
-        filtered_kwargs = {key:value for key, value in kwargs.items() if key in QRCODE_KWARGS}
-        pdf.image(qrcode.make(data=text, **filtered_kwargs).get_image(), x1, y1, w=x2 - x1, h=y2 - y1, link="")
+    if not text:
+        return
+    filtered_kwargs = {key:value for key, value in kwargs.items() if key in MATRIX_KWARGS}
+    matrix = build_qr_matrix(text, **filtered_kwargs)
+    border = kwargs.get("border", 4)
+    side = len(matrix) + 2 * border
+    module_size = (x2 - x1) / side
+    draw_matrix_runs(pdf, matrix, x1 + border * module_size, y1 + border * module_size, module_size)
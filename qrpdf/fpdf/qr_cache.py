@@ -0,0 +1,102 @@
+""" Caching for QR code module matrices """
+
+__author__ = "Arthur Moore <Arthur.Moore.git@cd-net.net>"
+__copyright__ = "Copyright (C) 2021 Arthur Moore"
+__license__ = "MIT"
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Set, Tuple, Union
+
+import qrcode
+from qrcode.constants import ERROR_CORRECT_M
+
+Matrix = Tuple[Tuple[bool, ...], ...]
+
+# Matrices encoded ahead of time by `prewarm_qr_matrices`, consumed by `build_qr_matrix`
+_prewarmed: Dict[tuple, Matrix] = {}
+
+# Every key prewarming has ever encoded.  `build_qr_matrix` pops `_prewarmed`
+# entries as its lru_cache absorbs them, so this set (not the dict) is what
+# tells later prewarm calls the work is already done.
+_prewarmed_keys: Set[tuple] = set()
+
+
+def _encode_qr(payload: Union[str, bytes],
+               version: Optional[int] = None,
+               error_correction: int = ERROR_CORRECT_M,
+               mask_pattern: Optional[int] = None,
+               ) -> Matrix:
+    """ Encode a single QR code.  Module scope, so it is picklable for worker processes. """
+    qr = qrcode.QRCode(version=version, error_correction=error_correction, mask_pattern=mask_pattern)
+    qr.add_data(payload)
+    qr.make()
+    return tuple(tuple(bool(module) for module in row) for row in qr.modules)
+
+
+def _encode_qr_args(args: tuple) -> Matrix:
+    """ `executor.map` compatible wrapper of `_encode_qr` """
+    return _encode_qr(*args)
+
+
+@lru_cache(maxsize=1024)
+def build_qr_matrix(payload: Union[str, bytes],
+                    version: Optional[int] = None,
+                    error_correction: int = ERROR_CORRECT_M,
+                    mask_pattern: Optional[int] = None,
+                    ) -> Matrix:
+    """
+    Build the module matrix for a QR code, caching the result per unique payload.
+
+    Encoding (Reed-Solomon coding plus mask selection and penalty scoring) is by far
+    the most expensive part of rendering a QR code,
+    so pages full of identical payloads only ever pay for it once.
+
+    Only parameters that change the matrix itself are part of the cache key.
+    Render-only parameters (`box_size`, `border`) belong to the caller.
+
+    :param payload: The data to encode
+    :param version: The QR version to use (None means the smallest that fits)
+    :param error_correction: One of the `qrcode.ERROR_CORRECT_*` constants
+    :param mask_pattern: The mask pattern to use (None means the best one is chosen)
+    :return: The module matrix as a tuple of tuples of bools (hashable, safe to share)
+    """
+    matrix = _prewarmed.pop((payload, version, error_correction, mask_pattern), None)
+    if matrix is not None:
+        return matrix
+    return _encode_qr(payload, version, error_correction, mask_pattern)
+
+
+def prewarm_qr_matrices(payloads: Iterable[Union[str, bytes]],
+                        version: Optional[int] = None,
+                        error_correction: int = ERROR_CORRECT_M,
+                        mask_pattern: Optional[int] = None,
+                        min_payloads: int = 8,
+                        ):
+    """
+    Encode many payloads in parallel, so later `build_qr_matrix` calls are cache hits.
+
+    Encoding is CPU bound pure Python (the GIL is held throughout),
+    so worker processes are used rather than threads.
+    Worker startup is not free: nothing is done below `min_payloads` unique payloads,
+    where the serial path wins anyway.
+
+    :param payloads: The data each QR code will encode.  Duplicates are dropped.
+    :param version: As for `build_qr_matrix`.  Must match the later calls to hit the cache.
+    :param error_correction: As for `build_qr_matrix`
+    :param mask_pattern: As for `build_qr_matrix`
+    :param min_payloads: Minimum number of unique payloads worth spawning workers for
+    """
+    # Drop anything already encoded, so prewarming a warm cache is a no-op
+    args = [arg for arg in dict.fromkeys((payload, version, error_correction, mask_pattern)
+                                         for payload in payloads)
+            if arg not in _prewarmed_keys]
+    if len(args) < min_payloads:
+        return
+    workers = os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, len(args) // (4 * workers))
+        for arg, matrix in zip(args, executor.map(_encode_qr_args, args, chunksize=chunksize)):
+            _prewarmed[arg] = matrix
+            _prewarmed_keys.add(arg)
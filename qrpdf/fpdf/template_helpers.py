@@ -4,19 +4,55 @@ __author__ = "Arthur Moore <Arthur.Moore.git@cd-net.net>"
 __copyright__ = "Copyright (C) 2021 Arthur Moore"
 __license__ = "MIT"
 
+import math
 from collections.abc import Sequence
-from typing import Union, Tuple, Iterator
+from functools import cache
+from itertools import product
+from typing import Union, Tuple, Iterator, Optional
 
+import numpy as np
 from fpdf.fpdf import get_page_format
 
 from .helpers import convert_unit
 
+try:
+    from numba import njit
+except ImportError:  # numba is optional; everything below works without it
+    njit = None
+
+if njit is not None:
+    @njit(cache=True)
+    def _grid_points_kernel(offset_x: float, offset_y: float,
+                            cell_width: float, cell_height: float,
+                            x_count: int, y_count: int,
+                            out: np.ndarray):
+        """ Fill `out` (an `(x_count*y_count, 2)` array) with grid start points """
+        k = 0
+        for iy in range(y_count):
+            y = offset_y + cell_height * iy
+            for ix in range(x_count):
+                out[k, 0] = offset_x + cell_width * ix
+                out[k, 1] = y
+                k += 1
+else:
+    _grid_points_kernel = None
+
+
+@cache
+def _get_page_format_cached(page_format: str, k: float) -> Tuple[float, float]:
+    """ Cached wrapper of `fpdf.get_page_format` for (hashable) string page formats """
+    return get_page_format(page_format, k=k)
+
 
 class frange(Sequence):
     """
     Floating point range function, with the option of including the stop number if exactly reached
     """
 
+    # Tolerance for deciding whether the stop value is reached exactly.
+    # ULP-sized remainders from the division must not shift the count by one.
+    _EPS = 1e-9
+
     def __init__(self, start: float, stop: float, step: float = 1, include_stop: bool = False):
         """
         :param start: Starting Number
@@ -28,29 +64,161 @@ class frange(Sequence):
             raise ValueError("step must not be zero")
         self.start, self.stop, self.step = start, stop, step
         self.include_stop = include_stop
-        pass
+        # All-integer arguments describe exactly what range does in C; delegate to it
+        self._range: Optional[range] = None
+        if not include_stop and isinstance(start, int) and isinstance(stop, int) and isinstance(step, int):
+            self._range = range(start, stop, step)
+            self._len = len(self._range)
+            return
+        # start/stop/step never change after construction, so the length is
+        # computed exactly once here rather than on every __len__/__getitem__ call.
+        # A single divide, then index arithmetic with an explicit tolerance.
+        # Values are always enumerated as `start + k*step` (one rounding each),
+        # so the count must agree with that formula, not with any accumulated sum.
+        count = (stop - start) / step
+        out = math.floor(count + self._EPS)
+        exact_fit = abs(out * step + start - stop) <= self._EPS * max(abs(stop), 1.0)
+        # One extra point for an included exact fit OR a fractional remainder;
+        # bools add as ints, so no if/elif chain is needed
+        out += (include_stop and exact_fit) or (count - out > self._EPS)
+        self._len = max(out, 0)
 
     def __getitem__(self, key: Union[int, slice]) -> Union[float, "frange"]:
         if isinstance(key, slice):
-            return frange(self[slice.start], self[slice.stop], self.step)
-        if key >= self.__len__():
+            # Constant time: slice.indices normalizes None / negative bounds,
+            # and the new endpoints are direct arithmetic on the indices
+            start_index, stop_index, step_index = key.indices(self._len)
+            return frange(self.start + start_index * self.step,
+                          self.start + stop_index * self.step,
+                          self.step * step_index)
+        if self._range is not None:
+            return self._range[key]
+        if key < 0:
+            # Match range's negative index handling on the delegated path
+            key += self._len
+        if not 0 <= key < self._len:
             raise IndexError("index out of range")
         return self.step * key + self.start
 
     def __len__(self) -> int:
-        out, remainder = divmod(self.stop - self.start, self.step)
-        if remainder != 0:
-            out += 1
-        elif self.include_stop:
-            out += 1
-        return int(max(out, 0))
+        return self._len
+
+    def __iter__(self) -> Iterator[float]:
+        if self._range is not None:
+            return iter(self._range)
+        return self._iter_floats()
+
+    def __contains__(self, value: float) -> bool:
+        # Sequence's default __contains__ is a full O(n) scan through
+        # __getitem__; membership is really just index arithmetic
+        if self._range is not None:
+            return value in self._range
+        quotient = (value - self.start) / self.step
+        index = round(quotient)
+        return abs(quotient - index) <= self._EPS and 0 <= index < self._len
+
+    def _iter_floats(self) -> Iterator[float]:
+        # Sequence's default __iter__ would call __getitem__ (and its bounds
+        # check) per element; a C-level range drives this loop instead.
+        # Each value is start + k*step from its integer index - one rounding
+        # per value with no running sum, so there is no accumulated drift for
+        # compensated (Kahan) summation to fix.
+        start, step = self.start, self.step
+        for k in range(self._len):
+            yield step * k + start
+
+
+def grid_cell_count(effective_length: float, cell_size: float) -> int:
+    """
+    How many cells of `cell_size` fit along `effective_length`.
+
+    Matches the exact-fit semantics of `generate_grid_start_points` for one axis,
+    without generating any points.
+
+    :param effective_length: The page length along the axis, minus both margins
+    :param cell_size: The size of each cell along the axis
+    """
+    return len(frange(0, effective_length - cell_size, cell_size, True))
+
 
-    def __str__(self):
-        if self.step == 1 and not self.include_stop:
-            return f"frange({self.start}, {self.stop})"
-        elif not self.include_stop:
-            return f"frange({self.start}, {self.stop}, {self.step})"
-        return f"frange({self.start}, {self.stop}, {self.step}, {self.include_stop})"
+def generate_grid_start_points_array(cell_size: Union[float, Tuple[float, float]],
+                                     effective_page_width: float,
+                                     effective_page_height: float,
+                                     offset_x: float = 0,
+                                     offset_y: float = 0,
+                                     ) -> np.ndarray:
+    """
+    Generate fpdf cell start points for a grid, as an `(N, 2)` array of `(x, y)` rows.
+
+    Same semantics (and exact same values) as `generate_grid_start_points`,
+    but everything happens in a handful of vectorized NumPy operations,
+    so array-consuming callers never touch the points one at a time in Python.
+
+    :param cell_size: The size of each row/column.  Either a single number or `(width, height)`
+    :param effective_page_width: The width of the page to generate points for, minus the left and right margins.
+    :param effective_page_height: The height of the page to generate points for, minus the top and bottom margins.
+    :param offset_x: The X position to start at (left margin).  Added to every point.
+    :param offset_y: The Y position to start at (top margin).  Added to every point.
+    :return An `(N, 2)` float array of `(x_position, y_position)` rows in the **same unit** as given.
+    """
+    # Convert everything to a tuples
+    if not isinstance(cell_size, (tuple, list)):
+        cell_size = (cell_size, cell_size)
+
+    # Nothing fits; skip the counting machinery entirely
+    if effective_page_width < cell_size[0] or effective_page_height < cell_size[1]:
+        return np.empty((0, 2))
+
+    # One C-level arange per axis instead of per-point Python arithmetic.
+    # frange provides the counts (special handling is done so cells that exactly fit will work).
+    x_count = grid_cell_count(effective_page_width, cell_size[0])
+    y_count = grid_cell_count(effective_page_height, cell_size[1])
+
+    if _grid_points_kernel is not None:
+        # JIT compiled loop: same multiply-add per point, no intermediate meshgrid arrays
+        out = np.empty((x_count * y_count, 2))
+        _grid_points_kernel(float(offset_x), float(offset_y),
+                            float(cell_size[0]), float(cell_size[1]),
+                            x_count, y_count, out)
+        return out
+
+    x_starts = offset_x + cell_size[0] * np.arange(x_count)
+    y_starts = offset_y + cell_size[1] * np.arange(y_count)
+
+    grid_x, grid_y = np.meshgrid(x_starts, y_starts)
+    return np.stack((grid_x.ravel(), grid_y.ravel()), axis=1)
+
+
+def generate_grid_start_points_soa(cell_size: Union[float, Tuple[float, float]],
+                                   effective_page_width: float,
+                                   effective_page_height: float,
+                                   offset_x: float = 0,
+                                   offset_y: float = 0,
+                                   ) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Generate fpdf cell start points for a grid, as two parallel 1-D arrays `(xs, ys)`.
+
+    Same values and order as `generate_grid_start_points_array`, but structure-of-arrays:
+    consumers that transform x and y independently (unit conversion, width/height adds)
+    get each coordinate as one contiguous array, one vectorized pass per column.
+
+    :param cell_size: The size of each row/column.  Either a single number or `(width, height)`
+    :param effective_page_width: The width of the page to generate points for, minus the left and right margins.
+    :param effective_page_height: The height of the page to generate points for, minus the top and bottom margins.
+    :param offset_x: The X position to start at (left margin).  Added to every point.
+    :param offset_y: The Y position to start at (top margin).  Added to every point.
+    :return A `(xs, ys)` pair of length-N float arrays in the **same unit** as given.
+    """
+    if not isinstance(cell_size, (tuple, list)):
+        cell_size = (cell_size, cell_size)
+    # Nothing fits; skip the counting machinery entirely
+    if effective_page_width < cell_size[0] or effective_page_height < cell_size[1]:
+        return np.empty(0), np.empty(0)
+    x_count = grid_cell_count(effective_page_width, cell_size[0])
+    y_count = grid_cell_count(effective_page_height, cell_size[1])
+    x_starts = offset_x + cell_size[0] * np.arange(x_count)
+    y_starts = offset_y + cell_size[1] * np.arange(y_count)
+    return np.tile(x_starts, y_count), np.repeat(y_starts, x_count)
 
 
 def generate_grid_start_points(cell_size: Union[float, Tuple[float, float]],
@@ -71,6 +239,9 @@ def generate_grid_start_points(cell_size: Union[float, Tuple[float, float]],
     Add any such spacing the cell_size, and merely do not include it when computing either
     the other point(s) needed for the grid, or the real cell height and width.
 
+    Produces the exact same values as `generate_grid_start_points_array`,
+    but lazily: nothing is materialized up front, so huge grids cost no memory.
+
     :param cell_size: The size of each row/column.  Either a single number or `(width, height)`
     :param effective_page_width: The width of the page to generate points for, minus the left and right margins.
     :param effective_page_height: The height of the page to generate points for, minus the top and bottom margins.
@@ -78,18 +249,70 @@ def generate_grid_start_points(cell_size: Union[float, Tuple[float, float]],
     :param offset_y: The Y position to start at (top margin).  Added to every point.
     :return An iterator of tuples in the format (x_position, y_position) in the **same unit** as given.
     """
-
-    # Convert everything to a tuples
     if not isinstance(cell_size, (tuple, list)):
         cell_size = (cell_size, cell_size)
+    cell_width, cell_height = cell_size[0], cell_size[1]
+
+    # Nothing fits; skip the counting machinery entirely
+    if effective_page_width < cell_width or effective_page_height < cell_height:
+        return
 
-    # Generate the points (special handling is done so cells that exactly fit will work)
-    x_starts = frange(offset_x, effective_page_width - cell_size[0] + offset_x, cell_size[0], True)
-    y_starts = frange(offset_y, effective_page_height - cell_size[1] + offset_y, cell_size[1], True)
+    # One C-level arange per axis, matching the array variant bit for bit
+    x_count = grid_cell_count(effective_page_width, cell_width)
+    y_count = grid_cell_count(effective_page_height, cell_height)
+    x_starts = (offset_x + cell_width * np.arange(x_count)).tolist()
+    y_starts = (offset_y + cell_height * np.arange(y_count)).tolist()
 
-    for y in y_starts:
-        for x in x_starts:
-            yield x, y
+    # product iterates in C; the single remaining Python frame just swaps to (x, y)
+    for y, x in product(y_starts, x_starts):
+        yield x, y
+
+
+def generate_element_grid_array(size: Union[float, Tuple[float, float]],
+                                col_spacing: float, row_spacing: float,
+                                margins: Union[float, Tuple[float, float, float, float]],
+                                page_format: Union[str, Tuple[float, float]],
+                                unit: str,
+                                ) -> np.ndarray:
+    """
+    Create the coordinates for a grid of elements, as an `(N, 4)` array of `[x1, y1, x2, y2]` rows.
+
+    All the arithmetic (grid generation, unit conversion, width/height add)
+    happens in a few vectorized passes; no per-element Python math anywhere.
+
+    :param size: The size of each element. Either a single number or `(width, height)`
+    :param col_spacing: The empty space between each column
+    :param row_spacing: The empty space between each row
+    :param margins: The page margins (either a single number or `(left, top, right, bottom)`)
+    :param page_format: Any page format string as accepted by `fpdf.get_page_format(...)` or a tuple of max page size
+    :param unit: The units all other parameters are in. As accepted by `fpdf.FPDF`
+    :returns An `(N, 4)` float array of element coordinates, in mm.
+    """
+    # Make sure size is in the correct format
+    if not isinstance(size, (tuple, list)):
+        size = (size, size)
+    if not isinstance(margins, (tuple, list)):
+        margins = (margins, margins, margins, margins)
+
+    width, height = size[0], size[1]
+    if isinstance(page_format, str):
+        page_size = convert_unit(_get_page_format_cached(page_format, 1), 1, unit)
+    else:
+        page_size = convert_unit(get_page_format(page_format, k=1), 1, unit)
+
+    points = generate_grid_start_points_array(cell_size=(width + col_spacing, height + row_spacing),
+                                              effective_page_width=page_size[0] - margins[0] - margins[2],
+                                              effective_page_height=page_size[1] - margins[1] - margins[3],
+                                              offset_x=margins[0],
+                                              offset_y=margins[1])
+    # Convert to mm here, in one vectorized pass rather than per element in a loop
+    unit_translation_factor = convert_unit(1, unit, "mm")
+    points *= unit_translation_factor  # Freshly allocated, so in-place is safe
+    x1_values = points[:, 0]
+    y1_values = points[:, 1]
+    return np.column_stack((x1_values, y1_values,
+                            x1_values + width * unit_translation_factor,
+                            y1_values + height * unit_translation_factor))
 
 
 def generate_element_grid(size: Union[float, Tuple[float, float]],
@@ -110,31 +333,8 @@ def generate_element_grid(size: Union[float, Tuple[float, float]],
     :param element_template: A copyable dict to be used for each element.
     :returns Elements for fpdf.Template, with points in mm.  Since, that's the only unit it accepts!
     """
-    # Multiply by this to go from one unit to another
-    unit_translation_factor = convert_unit(1, unit, "mm")
-    # Make sure size is in the correct format
-    if not isinstance(size, (tuple, list)):
-        size = (size, size)
-    if not isinstance(margins, (tuple, list)):
-        margins = (margins, margins, margins, margins)
-
-    width, height = size[0], size[1]
-    page_size = convert_unit(get_page_format(page_format, k=1), 1, unit)
-
-    points = generate_grid_start_points(cell_size=(width + col_spacing, height + row_spacing),
-                                        effective_page_width=page_size[0] - margins[0] - margins[2],
-                                        effective_page_height = page_size[1] - margins[1] - margins[3],
-                                        offset_x=margins[0],
-                                        offset_y=margins[1])
-    # Convert to mm here
-    width, height = width * unit_translation_factor, height * unit_translation_factor
-    for i, (x, y) in enumerate(points):
-        # This is O(n), but is simpler than doing all the conversions earlier
-        x, y = x * unit_translation_factor, y * unit_translation_factor
-        element = element_template.copy()
-        element["name"] = element.get("name", "") + "_{}".format(i)
-        element["x1"] = x
-        element["y1"] = y
-        element["x2"] = x + width
-        element["y2"] = y + height
-        yield element
+    coordinates = generate_element_grid_array(size, col_spacing, row_spacing, margins, page_format, unit)
+    base_name = element_template.get("name", "")
+    for i, (x1, y1, x2, y2) in enumerate(coordinates.tolist()):
+        # A single-op dict merge beats copy() plus five __setitem__ calls
+        yield {**element_template, "name": f"{base_name}_{i}", "x1": x1, "y1": y1, "x2": x2, "y2": y2}
@@ -41,15 +41,15 @@ __author__ = "Arthur Moore <Arthur.Moore.git@cd-net.net>"
 __copyright__ = "Copyright (C) 2021 Arthur Moore"
 __license__ = "MIT"
 
-import re
 import struct
 import mmap
+from bisect import bisect_right
 from collections.abc import Sized, Hashable
 from hashlib import md5
-from io import BufferedIOBase
+from io import BufferedIOBase, BufferedWriter, RawIOBase
 from logging import getLogger
 from pathlib import Path
-from typing import NamedTuple, List, Union, Optional, Iterator, Tuple
+from typing import NamedTuple, Dict, List, Union, Optional, Iterator, Tuple
 from tarfile import BLOCKSIZE as TAR_BLOCK_SIZE
 
 logger = getLogger()
@@ -77,14 +77,22 @@ PACKET_TYPES = {
 # Use for identifying packets
 PACKET_LOOKUP = {value: key for key, value in PACKET_TYPES.items()}
 
+# Compiled once at import; re-parsing the format string per packet is pure overhead
+_HEADER_STRUCT = struct.Struct("<" + "8s" + "Q" + MD5_FORMAT + MD5_FORMAT + "16s")
+
 # This is used so often, it's worth just defining it
-PACKET_HEADER_SIZE = 64
+PACKET_HEADER_SIZE = _HEADER_STRUCT.size
+
+# Shared padding buffer; no block ever needs more than one block's worth of zeros,
+# so slicing a memoryview of this avoids allocating a fresh bytes object per block
+_ZEROS = bytes(TAR_BLOCK_SIZE)
+_ZEROS_MV = memoryview(_ZEROS)
 
 
 # noinspection PyNamedTuple
 class PacketHeader(NamedTuple):
     """ The header for every par2 packet """
-    _format = "<" + "8s" + "Q" + MD5_FORMAT + MD5_FORMAT + "16s"
+    _format = _HEADER_STRUCT.format  # Kept for documentation; use _HEADER_STRUCT directly
     _magic_expected = b'PAR2\x00PKT'
     magic: bytes  # Should always be b'PAR2\x00PKT'
     length: int  # Of entire packet (including header)
@@ -95,7 +103,7 @@ class PacketHeader(NamedTuple):
     @classmethod
     def from_bytes(cls, data: bytes) -> "PacketHeader":
         """ Create from raw binary data """
-        out = cls._make(struct.unpack_from(cls._format, data))
+        out = cls._make(_HEADER_STRUCT.unpack_from(data))
         if not out.is_valid():
             raise ValueError("Not a valid par2 packet header")
         return out
@@ -107,7 +115,7 @@ class PacketHeader(NamedTuple):
 
         Useful for determining offsets and minimum data for `from_bytes`.
         """
-        return struct.calcsize(cls._format)
+        return _HEADER_STRUCT.size
 
     def is_valid(self) -> bool:
         """ If the header matches what it is supposed to (does not check hash) """
@@ -115,7 +123,7 @@ class PacketHeader(NamedTuple):
                self.signature in PACKET_LOOKUP
 
     def __bytes__(self) -> bytes:
-        return struct.pack(self._format, *self)
+        return _HEADER_STRUCT.pack(*self)
 
     @property
     def type(self) -> str:
@@ -138,9 +146,11 @@ class Packet(Sized, Hashable):
                               signature=PACKET_TYPES.get(packet_type, b''))
         self._header: PacketHeader = header  # Make sure someone knows what they're doing when writing to this
         self._data_after_header: bytes = data
+        self._cached_bytes: Optional[bytes] = None
         if packet_type != "Unknown":
             # Don't bother doing a hash when the data is likely to be overwritten immediately
             self._header = self._header._replace(hash=self._generate_hash())
+            self._cached_bytes = None  # The bytes cached while hashing used the old header
 
     def __repr__(self):
         return "<Par2 Packet: {} ({} bytes)>".format(self.header.type, self.__len__())
@@ -170,8 +180,12 @@ class Packet(Sized, Hashable):
         """
         Get the packet as raw data
         WARNING: Even if the packet was built from a memoryview, this still returns bytes.
+
+        The result is cached, since `optimize_for_tar` serializes some packets more than once.
         """
-        return bytes(self.header) + self._data_after_header
+        if self._cached_bytes is None:
+            self._cached_bytes = bytes(self.header) + self._data_after_header
+        return self._cached_bytes
 
     @property
     def header(self) -> PacketHeader:
@@ -181,11 +195,16 @@ class Packet(Sized, Hashable):
         """
         If the packet is (seems) valid
 
-        Does not perform extensive internal checks, just basic matching to header
+        Does not perform extensive internal checks, just basic matching to header.
+        The packet hash is deliberately NOT recomputed here, since MD5 over every
+        scanned packet is expensive.  Use `verify_hash` at trust boundaries.
         """
         return self.header.is_valid() and \
-               (len(self._data_after_header) + PACKET_HEADER_SIZE) == self.header.length and \
-               (self._generate_hash() == self.header.hash)
+               (len(self._data_after_header) + PACKET_HEADER_SIZE) == self.header.length
+
+    def verify_hash(self) -> bool:
+        """ If the packet data actually matches the MD5 hash in the header """
+        return self._generate_hash() == self.header.hash
 
     def __len__(self):
         """ The size of the entire packet (including header) """
@@ -195,14 +214,18 @@ class Packet(Sized, Hashable):
         """
         Check if the other packet is the same (fast)
 
-        This mostly just compares headers.  It assumes both are valid!
+        This just compares the MD5 fields, which already uniquely identify the
+        packet contents.  It assumes both are valid!
         """
+        if other is self:
+            return True
         if not isinstance(other, self.__class__):
             return False
-        return self.header == other.header
+        return self._header.hash == other._header.hash
 
     def __hash__(self):
-        return self.header.__hash__()
+        # The MD5 field alone identifies the packet; no need to hash all five header fields
+        return hash(self._header.hash)
 
 
 class CreatorPacket(Packet):
@@ -228,12 +251,19 @@ class CreatorPacket(Packet):
         packet = cls()
         packet._header = parent._header
         packet._data_after_header = parent._data_after_header
+        packet._cached_bytes = None  # Drop the empty-packet bytes cached during __init__
         return packet
 
     @property
     def client(self) -> str:
         """ Get the client encoded by the packet """
-        return bytes(self._data_after_header).rstrip(b'\0').decode()
+        # Scan for the last non-padding byte and copy once, rather than
+        # copying the whole memoryview just for rstrip to copy it again
+        data = self._data_after_header
+        end = len(data)
+        while end > 0 and data[end - 1] == 0:
+            end -= 1
+        return bytes(data[:end]).decode()
 
 
 def packet_factory(data: Union[bytes, memoryview]):
@@ -254,16 +284,25 @@ def get_packets(data: Union[bytes, memoryview], packet_type: Optional[str] = Non
     Get all the packets of a particular type.  If no type is given, returns all packets.
 
     WARNING: packets are generated with non-header data as a `memoryview`.
+    WARNING: packet hashes are not verified.  Call `Packet.verify_hash` on any packet
+    whose contents are not trusted.
 
     :param data: The data to search through.
     :param packet_type: The type of packet to look for. PACKET_TYPES.keys()
     """
-    data = memoryview(data)
-    packet_search = re.compile(PacketHeader._magic_expected)
-    for match in packet_search.finditer(data):
-        packet = packet_factory(data[match.start():])
-        if packet_type is None or packet.header.type == packet_type:
-            yield packet
+    if not isinstance(data, (bytes, bytearray, mmap.mmap)):
+        data = bytes(data)  # find() needs a real buffer; memoryview has none
+    view = memoryview(data)
+    needle = PacketHeader._magic_expected
+    # The signature lives at a fixed header offset (after magic, length, hash, and set_id),
+    # so peek at it before paying for a full PacketHeader + Packet per candidate
+    wanted_signature = PACKET_TYPES[packet_type] if packet_type is not None else None
+    # find() is a C-level Boyer-Moore-Horspool scan; no regex engine, no Match objects
+    position = data.find(needle)
+    while position >= 0:
+        if wanted_signature is None or bytes(view[position + 48:position + 64]) == wanted_signature:
+            yield packet_factory(view[position:])
+        position = data.find(needle, position + len(needle))
 
 
 def get_packet_unique(data: Union[bytes, memoryview], packet_type: str) -> Optional[Packet]:
@@ -277,6 +316,34 @@ def get_packet_unique(data: Union[bytes, memoryview], packet_type: str) -> Optio
     """
 
 
+def _index_packets(data: Union[bytes, bytearray, mmap.mmap]) -> Dict[str, list]:
+    """
+    Scan the data once, bucketing every packet by type.
+
+    RecoveryBlock packets usually dominate the file,
+    so only their start offsets are recorded; everything else becomes a Packet.
+
+    WARNING: packets are generated with non-header data as a `memoryview`.
+
+    :param data: The data to search through.
+    :return: packet type -> list of Packets, except "RecoveryBlock" -> list of start offsets
+    """
+    if not isinstance(data, (bytes, bytearray, mmap.mmap)):
+        data = bytes(data)
+    view = memoryview(data)
+    index: Dict[str, list] = {packet_type: [] for packet_type in PACKET_TYPES}
+    needle = PacketHeader._magic_expected
+    position = data.find(needle)
+    while position >= 0:
+        header = PacketHeader.from_bytes(view[position:position + PACKET_HEADER_SIZE])
+        if header.type == "RecoveryBlock":
+            index["RecoveryBlock"].append(position)
+        else:
+            index[header.type].append(packet_factory(view[position:]))
+        position = data.find(needle, position + len(needle))
+    return index
+
+
 def _get_unused_block_size(used: int):
     """
     Get how many bytes are remaining in the current block.
@@ -289,16 +356,18 @@ def _get_unused_block_size(used: int):
     return TAR_BLOCK_SIZE - used
 
 
-def _get_optimized_main(data: Union[bytearray, bytes, memoryview]) -> Tuple[bytes, Optional[CreatorPacket]]:
+def _get_optimized_main(index: Dict[str, list]) -> Tuple[bytearray, Optional[CreatorPacket]]:
     """
     Get a Main packet optimized for use in tar files.
     This means it is padded/aligned to 512 bytes,
     and (if possible) the Creator and Main packets share a block.
 
     Otherwise, the Creator packet will be output separately for possible inclusion later.
+
+    :param index: A packet index from `_index_packets`
     """
-    creator_packets = list(get_packets(data, "Creator"))
-    main_packets = list(get_packets(data, "Main"))
+    creator_packets = list(index["Creator"])
+    main_packets = list(index["Main"])
 
     # Verification
     if len(creator_packets) > 1:
@@ -322,20 +391,66 @@ def _get_optimized_main(data: Union[bytearray, bytes, memoryview]) -> Tuple[byte
         date = datetime.now().date()
         creator_packets.append(CreatorPacket("qr-pdf on {}".format(date), main_packets[0].header.set_id))
 
-    out = bytes(main_packets[0])
+    out = bytearray(bytes(main_packets[0]))
     creator_out = None
     bin_bytes_remaining = _get_unused_block_size(len(main_packets[0]))
     if bin_bytes_remaining >= len(creator_packets[0]):
-        out += bytes(creator_packets[0])
+        out.extend(bytes(creator_packets[0]))
         bin_bytes_remaining -= len(creator_packets[0])
     else:
         creator_out = creator_packets[0]
         logger.info("Not Enough Space to pack Creator packet with Main packet")
-    out += b'\0' * bin_bytes_remaining
+    out.extend(_ZEROS_MV[:bin_bytes_remaining])
     return out, creator_out
 
 
-def _get_optimized_file_data(data: Union[bytearray, bytes, memoryview]) -> bytes:
+def _plan_file_bins(packet_lengths: List[int]) -> List[Tuple[int, int]]:
+    """
+    Plan the bin-packed write order for size-sorted packets.
+
+    Use Bin Packing to optimally pack them using a variation of First Fit Decreasing and Best-Fit Algorithms
+    The differences are:
+    * Items are sorted as in First Fit Decreasing
+    * Some items may be larger than a single bin, and the remainder must be filled/packed immediately
+    * Write once, so only a single bin may be open at once
+    * Items may be skipped
+    https://en.wikipedia.org/wiki/Bin_packing_problem
+    Solution is:
+    * Sort the list by size (smallest first)
+    * Each outer iteration packs a single bin with at least one packet:
+      * Move the largest remaining packet to a new bin
+      * Repeatedly bisect for the largest remaining packet that still fits, moving it to the bin
+      * Close the bin
+    The outer iteration can pack multiple bins if a packet is too large for a single one.
+    Bisecting the size-sorted list makes this O(n log n) instead of a full O(n) scan per bin.
+
+    This is deliberately plain integer arithmetic over plain lists, with no Packet
+    objects in sight, so a compiled drop-in replacement stays trivial to write.
+
+    :param packet_lengths: Packet lengths, sorted ascending.  Consumed.
+    :return: (index, pad_after) pairs in write order, where index is the position in
+        the ascending-sorted input and pad_after is the zero padding closing the
+        packet's bin (0 for packets mid-bin).
+    """
+    indices = list(range(len(packet_lengths)))
+    plan: List[Tuple[int, int]] = []
+    while packet_lengths:
+        length = packet_lengths.pop()  # Handle at least one (the largest) packet per iteration
+        plan.append((indices.pop(), 0))
+        bin_bytes_remaining = _get_unused_block_size(length)
+        # No packet smaller than its header will ever exist, so stop early once only that much is left
+        while bin_bytes_remaining > PACKET_HEADER_SIZE and packet_lengths:
+            i = bisect_right(packet_lengths, bin_bytes_remaining) - 1
+            if i < 0:
+                break  # Nothing else fits
+            plan.append((indices.pop(i), 0))
+            bin_bytes_remaining -= packet_lengths.pop(i)
+        # All possible packets are written, so close the bin
+        plan[-1] = (plan[-1][0], bin_bytes_remaining)
+    return plan
+
+
+def _get_optimized_file_data(index: Dict[str, list]) -> bytearray:
     """
     Get all the file packets optimized for use in tar files.
     This means everything is padded/aligned to 512 bytes,
@@ -343,45 +458,21 @@ def _get_optimized_file_data(data: Union[bytearray, bytes, memoryview]) -> bytes
 
     WARNING: This produces a bytes object slightly greater than the index / hash information for all files.
     Which may be large!
+
+    :param index: A packet index from `_index_packets`
     """
-    out = b''
-    # Extract "FileDescription" and "FileVerification" packets
-    file_packets: List[Packet] = list(set(get_packets(data, "FileDescription")) |
-                                      set(get_packets(data, "FileVerification")))
-    # Use Bin Packing to optimally pack them using a variation of First Fit Decreasing and Best-Fit Algorithms
-    # The differences are:
-    # * Items are sorted as in First Fit Decreasing
-    # * Some items may be larger than a single bin, and the remainder must be filled/packed immediately
-    # * Write once, so only a single bin may be open at once
-    # * Items may be skipped
-    # https://en.wikipedia.org/wiki/Bin_packing_problem
-    # Solution is:
-    # * Sort the list (largest first)
-    # * Each outer iteration packs a single bin with ot least one packet:
-    #   * Move the largest remaining packet to a new bin
-    #   * Iterate through all the remaining packets, moving them to the bin if possible
-    #   * Close the bin
-    # The outer iteration can pack multiple bins if a packet is too large for a single one.
-    file_packets.sort(key=len, reverse=True)
-    while len(file_packets):
-        packet = file_packets.pop(0)  # Handle at least one packet per iteration
-        out += bytes(packet)
-        bin_bytes_remaining = _get_unused_block_size(len(packet))
-        if bin_bytes_remaining <= PACKET_HEADER_SIZE:
-            # Optimization. Nothing will fit, so close the bin
-            out += b'\0' * bin_bytes_remaining
-            continue
-        to_drop = []  # Implementation detail, python lists should never be modified while being iterated through.
-        for i, packet in enumerate(file_packets):
-            # Only have to do this once to fill the bin
-            if len(packet) <= bin_bytes_remaining:
-                out += bytes(packet)
-                bin_bytes_remaining -= len(packet)
-                to_drop.append(i)
-        for i in sorted(to_drop, reverse=True):
-            del file_packets[i]  # drop from highest index down
-        # All possible packets are written, so close the bin
-        out += b'\0' * bin_bytes_remaining
+    # Extract "FileDescription" and "FileVerification" packets,
+    # deduplicated by their MD5 field in a single pass (no intermediate sets)
+    file_packets: List[Packet] = list({packet.header.hash: packet
+                                       for packet in index["FileDescription"] + index["FileVerification"]
+                                       }.values())
+    file_packets.sort(key=len)
+    plan = _plan_file_bins([len(packet) for packet in file_packets])
+    # A bytearray grows in place; repeated += on bytes would copy the whole buffer each time
+    out = bytearray()
+    for i, pad_after in plan:
+        out.extend(bytes(file_packets[i]))
+        out.extend(_ZEROS_MV[:pad_after])
     return out
 
 
@@ -409,34 +500,51 @@ def optimize_for_tar(in_file: Union[str, Path, bytearray, bytes], out: Union[str
         except mmap.error as e:
             in_file_handle.close()
             raise e
+        try:
+            # The whole file is consumed front to back, so let the kernel prefetch
+            # aggressively and drop pages behind the scan
+            in_file.madvise(mmap.MADV_SEQUENTIAL)
+            in_file.madvise(mmap.MADV_WILLNEED)
+        except AttributeError:
+            pass  # Not available on this platform (e.g. Windows)
 
     if isinstance(out, str):
         out = Path(out)
-    if not isinstance(out, BufferedIOBase):
-        out = out.open("wb")
+    if isinstance(out, Path):
+        out = out.open("wb")  # Already buffered
+    if isinstance(out, RawIOBase):
+        # Coalesce the many small header / padding writes into large syscalls
+        out = BufferedWriter(out, buffer_size=1 << 20)
 
     written = 0
 
+    # Every packet is found in a single scan of the file
+    index = _index_packets(in_file)
+    view = memoryview(in_file)
+
     # Get the Main / Creator packets and write one copy of Main at the start
-    main_data, creator_packet = _get_optimized_main(in_file)
+    main_data, creator_packet = _get_optimized_main(index)
     written += out.write(main_data)
 
     # Get the file packets and write one copy at the start
-    file_data = _get_optimized_file_data(in_file)
+    file_data = _get_optimized_file_data(index)
     written += out.write(file_data)
     header_block_size = (len(main_data) + len(file_data)) / TAR_BLOCK_SIZE
     assert int(header_block_size) == header_block_size, "Everything should be in terms of whole blcks"
     logger.info("Header takes {} blocks".format(int(header_block_size)))
 
-    # Extract RecoveryBlock packets
+    # Write out RecoveryBlock packets as raw slices straight from their offsets.
+    # They dominate the file, and only their length field is needed,
+    # so no Packet (or even PacketHeader) is ever materialized for them.
     recovery_count = 0
     recovery_written = 0
-    for packet in get_packets(in_file, "RecoveryBlock"):
+    for offset in index["RecoveryBlock"]:
+        length = int.from_bytes(view[offset + 8:offset + 16], "little")
         recovery_count += 1
-        recovery_written += out.write(bytes(packet))
+        recovery_written += out.write(view[offset:offset + length])
         # Never try to stuff recovery packets, and instead pad the current block
-        bin_bytes_remaining = _get_unused_block_size(len(packet))
-        recovery_written += out.write(b'\0' * bin_bytes_remaining)
+        bin_bytes_remaining = _get_unused_block_size(length)
+        recovery_written += out.write(_ZEROS_MV[:bin_bytes_remaining])
     written += recovery_written
     logger.info("Wrote {} Recovery packets in {} blocks".format(recovery_count, int(recovery_written / TAR_BLOCK_SIZE)))
     # if creator_packet is not None:
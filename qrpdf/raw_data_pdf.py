@@ -1,4 +1,4 @@
-from collections import Mapping
+from collections.abc import Mapping
 from typing import Tuple, Union, List, Iterator
 
 from fpdf import FPDF, Template
@@ -6,7 +6,8 @@ from fpdf import FPDF, Template
 import qrcode
 
 from .fpdf.helpers import get_scale_factor, convert_unit
-from .fpdf.template_helpers import generate_grid_start_points
+from .fpdf.qr_cache import prewarm_qr_matrices
+from .fpdf.template_helpers import generate_grid_start_points, grid_cell_count
 from .fpdf.qr import qr_handler
 
 
@@ -22,7 +23,7 @@ class RawDataPDF:
         "text": None,
         "box_size": 2,
         "border": 0,
-        "error_correction": qrcode.ERROR_CORRECT_Q
+        "error_correction": qrcode.ERROR_CORRECT_M
     }
     BASE_TEXT_TEMPLATE = {
         "name": "text_{}",
@@ -33,11 +34,13 @@ class RawDataPDF:
         "size": 10
     }
 
-    def __init__(self, pdf=None, qr_physical_size=2, **kwargs):
+    def __init__(self, pdf=None, qr_physical_size=2, error_correction=qrcode.ERROR_CORRECT_M, **kwargs):
         """
 
         :param pdf:
         :param qr_physical_size:
+        :param error_correction: The `qrcode.ERROR_CORRECT_*` level for the QR codes.
+            Lower levels produce smaller matrices, so fewer modules to draw and scan.
         :param kwargs:
         """
         if pdf is None:
@@ -46,6 +49,8 @@ class RawDataPDF:
         self.column_spacing = 0.1
         self.row_spacing = 0.1
         self.qr_template = self.BASE_QR_TEMPLATE.copy()
+        self.qr_template["error_correction"] = error_correction
+        self._elements_per_page_cache = {}
         self.text_template = self.BASE_TEXT_TEMPLATE.copy()
 
     def _generate_grid_start_points(self, cell_size: Union[float, Tuple[float, float]]) -> Iterator[Tuple[float, float]]:
@@ -82,34 +87,43 @@ class RawDataPDF:
             cell_size=(self.qr_physical_size + self.column_spacing,
                        self.qr_physical_size + self.row_spacing + text_height))
 
+        # Hoist the loop invariants; the body runs once or twice per QR code
+        utf = unit_translation_factor
+        qr_size = self.qr_physical_size
+        qr_name = qr_template.get("name", "barcode_{}")
+        text_name = text_template.get("name", "text_{}") if text_template is not None else ""
         for i, (x, y) in enumerate(points):
-            # This is O(n), but is simpler than doing all the conversions earlier
-            element = qr_template.copy()
-            element["name"] = element.get("name", "barcode_{}").format(i)
-            element["x1"] = x * unit_translation_factor
-            element["y1"] = y * unit_translation_factor
-            element["x2"] = (x + self.qr_physical_size) * unit_translation_factor
-            element["y2"] = (y + self.qr_physical_size) * unit_translation_factor
-            yield element
+            x1 = x * utf
+            y1 = y * utf
+            x2 = (x + qr_size) * utf
+            y2 = (y + qr_size) * utf
+            # A single-op dict merge beats copy() plus six __setitem__ calls
+            yield {**qr_template, "name": qr_name.format(i), "x1": x1, "y1": y1, "x2": x2, "y2": y2}
             if not text_height:
                 continue
-            element = text_template.copy()
-            element["name"] = element.get("name", "text_{}").format(i)
-            element["x1"] = x * unit_translation_factor
-            element["y1"] = (y + self.qr_physical_size) * unit_translation_factor
-            element["x2"] = (x + self.qr_physical_size) * unit_translation_factor
-            element["y2"] = (y + self.qr_physical_size + text_height) * unit_translation_factor
-            yield element
+            y3 = (y + qr_size + text_height) * utf
+            yield {**text_template, "name": text_name.format(i), "x1": x1, "y1": y2, "x2": x2, "y2": y3}
 
     def get_elements_per_page(self, include_text=False) -> int:
         """
         How many QR Codes can fit on a single page
+
+        Computed closed-form from the page geometry (and cached),
+        rather than generating a page of elements just to count them.
         :param include_text: If each QR code should have text below it or not
         :return:
         """
-        if include_text:
-            return int(len(list(self.generate_qr_page_elements(self.qr_template, self.text_template)))  / 2)
-        return len(list(self.generate_qr_page_elements(self.qr_template)))
+        text_height = self.text_template.get("size", 0) / self.pdf.k if include_text else 0
+        key = (self.pdf.w, self.pdf.h, self.pdf.l_margin, self.pdf.t_margin,
+               self.pdf.r_margin, self.pdf.b_margin,
+               self.qr_physical_size, self.column_spacing, self.row_spacing, text_height)
+        count = self._elements_per_page_cache.get(key)
+        if count is None:
+            columns = grid_cell_count(self.pdf.epw, self.qr_physical_size + self.column_spacing)
+            rows = grid_cell_count(self.pdf.eph, self.qr_physical_size + self.row_spacing + text_height)
+            count = columns * rows
+            self._elements_per_page_cache[key] = count
+        return count
 
     def add_data_page(self, data: Union[Mapping, list]):
         """
@@ -118,23 +132,33 @@ class RawDataPDF:
         If data is a dict, then, each QR code will have the key displayed below it.
         If data is a list, then only the QR codes will be displayed
 
+        Cells are rendered one at a time, straight from the (cached) QR module matrix
+        into the page content stream.  No per-cell raster images are ever held,
+        so peak memory stays flat no matter how many cells fit on a page.
+
         :param data:
         :return:
         """
-        qr_key = self.qr_template["name"]
-        text_key = self.text_template["name"]
+        # Bind the bound methods once; the loops below call them per element
+        qr_key = self.qr_template["name"].format
+        text_key = self.text_template["name"].format
+
+        is_mapping = isinstance(data, Mapping)
+        # Check the size closed-form, before spending time materializing elements
+        max_data = self.get_elements_per_page(include_text=is_mapping)
+        if len(data) > max_data:
+            raise ValueError("A data page may only contain {} elements".format(max_data))
 
-        if isinstance(data, Mapping):
-            is_mapping = True
+        if is_mapping:
             elements = list(self.generate_qr_page_elements(self.qr_template, self.text_template))
-            max_data = int(len(elements) / 2)
         else:
-            is_mapping = False
             elements = list(self.generate_qr_page_elements(self.qr_template))
-            max_data = len(elements)
 
-        if len(data) > max_data:
-            raise ValueError("A data page may only contain {} elements".format(max_data))
+        # Encoding each QR code is independent and CPU bound, so warm the cache in parallel
+        prewarm_qr_matrices(data.values() if is_mapping else data,
+                            version=self.qr_template.get("version"),
+                            error_correction=self.qr_template.get("error_correction", qrcode.ERROR_CORRECT_M),
+                            mask_pattern=self.qr_template.get("mask_pattern"))
 
         template = Template(elements=elements)
         template.pdf = self.pdf
@@ -142,11 +166,11 @@ class RawDataPDF:
         template.add_page()
         if is_mapping:
             for i, (key, value) in enumerate(data.items()):
-                template.texts[1][text_key.format(i)] = key
-                template.texts[1][qr_key.format(i)] = value
+                template.texts[1][text_key(i)] = key
+                template.texts[1][qr_key(i)] = value
         else:
             for i, value in enumerate(data):
-                template.texts[1][qr_key.format(i)] = value
+                template.texts[1][qr_key(i)] = value
 
         # Need to adjust the PDF to work in mm, since that's all Template supports
         original_k = self.pdf.k
@@ -0,0 +1,26 @@
+from qrpdf.fpdf.qr_cache import build_qr_matrix
+
+
+def setup_function():
+    build_qr_matrix.cache_clear()
+
+
+def test_matrix_is_square():
+    matrix = build_qr_matrix(b"hello")
+    assert isinstance(matrix, tuple)
+    assert all(len(row) == len(matrix) for row in matrix)
+
+
+def test_identical_payloads_encode_once():
+    first = build_qr_matrix(b"hello")
+    second = build_qr_matrix(b"hello")
+    assert first is second
+    info = build_qr_matrix.cache_info()
+    assert info.misses == 1
+    assert info.hits == 1
+
+
+def test_different_payloads_encode_separately():
+    build_qr_matrix(b"hello")
+    build_qr_matrix(b"world")
+    assert build_qr_matrix.cache_info().misses == 2
@@ -0,0 +1,14 @@
+from qrpdf.fpdf.qr_fastdraw import extract_runs
+
+
+def test_extract_runs_empty_matrix():
+    assert extract_runs(()) == []
+
+
+def test_extract_runs_coalesces_adjacent_modules():
+    matrix = (
+        (True, True, False, True),
+        (False, False, False, False),
+        (True, True, True, True),
+    )
+    assert extract_runs(matrix) == [(0, 0, 2), (0, 3, 4), (2, 0, 4)]
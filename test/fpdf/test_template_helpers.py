@@ -2,7 +2,7 @@ from collections.abc import Iterator
 
 import pytest
 
-from qrpdf.fpdf.template_helpers import generate_grid_start_points, frange
+from qrpdf.fpdf.template_helpers import generate_grid_start_points, generate_grid_start_points_array, frange
 
 
 def test_frange_zero():
@@ -49,11 +49,32 @@ def test_frange_include_last_extra():
     assert fr_result == [0, 0.5, 1.0, 1.5, 2.0, 2.5, 3.0, 3.5, 4.0, 4.5, 5.0, 5.5, 6.0, 6.5, 7.0, 7.5, 8.0, 8.5]
 
 
+def test_frange_negative_index():
+    assert frange(0, 10, 2)[-1] == 8
+    assert frange(0.1, 8.5, 0.5)[-1] == 8.1
+    with pytest.raises(IndexError):
+        frange(0.1, 8.5, 0.5)[-100]
+
+
+def test_frange_contains():
+    fr = frange(0.1, 8.5, 0.5)
+    assert all(value in fr for value in fr)
+    assert 8.5 not in fr
+    assert 0.35 not in fr
+    assert 2 in frange(0, 10, 2)
+
+
 def test_generate_grid_start_points_returns_iterator():
     points = generate_grid_start_points(1, 10, 10)
     assert isinstance(points, Iterator)
 
 
+def test_generate_grid_start_points_array_matches_iterator():
+    points = generate_grid_start_points_array(1.5, 6.5, 9, 1, 1)
+    assert points.shape == (24, 2)
+    assert [tuple(point) for point in points.tolist()] == list(generate_grid_start_points(1.5, 6.5, 9, 1, 1))
+
+
 def test_create_simple_grid_points():
     points = generate_grid_start_points(1, 10, 10)
     points = list(points)